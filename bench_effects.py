@@ -0,0 +1,116 @@
+from data_structures import Color, CommandType
+from effects import *
+import asyncio
+import colorsys
+import time
+import timeit
+
+FRAMES = 1000
+
+
+class NoOpCommsDefinition:
+    def __init__(self, set_all: bool):
+        self.set_all = set_all
+
+    def has_set_all(self) -> bool:
+        return self.set_all
+
+
+class NoOpPortal:
+    """Builds the same command payloads as Portal but never sends them, so only our own cost is measured"""
+
+    def __init__(self, set_all: bool = True):
+        self.comms_def = NoOpCommsDefinition(set_all)
+
+    async def send_message(self, command: CommandType, data: list[int] = []):
+        bytes(data)
+
+    async def set_color(self, platform: int | Platform, color: Color):
+        await self.send_message(CommandType.SET_ONE, [int(platform), *color])
+
+    async def set_all_colors(self, colors: list[Color | None]):
+        msg = []
+        for color in colors:
+            if color is None:
+                msg.extend([0, 0, 0, 0])
+            else:
+                msg.extend([1, *color])
+        await self.send_message(CommandType.SET_ALL, msg)
+
+
+class PythonLoopRenderer:
+    """What rendering a rainbow looked like before: one Color per platform, built and diffed by hand"""
+
+    def __init__(self, portals: list[NoOpPortal]):
+        self.portals = portals
+        self.last_frame = None
+
+    async def show(self, t: float):
+        count = len(self.portals) * len(PLATFORMS)
+        frame = []
+        for i in range(len(self.portals)):
+            row = []
+            for j in range(len(PLATFORMS)):
+                r, g, b = colorsys.hsv_to_rgb(((i * len(PLATFORMS) + j) / count + t * 0.25) % 1.0, 1, 1)
+                row.append(Color(round(r * 255), round(g * 255), round(b * 255)))
+            frame.append(row)
+        tasks = []
+        for i, portal in enumerate(self.portals):
+            for j, platform in enumerate(PLATFORMS):
+                if self.last_frame is None or self.last_frame[i][j] != frame[i][j]:
+                    tasks.append(portal.set_color(platform, frame[i][j]))
+        await asyncio.gather(*tasks)
+        self.last_frame = frame
+
+
+def bench(name: str, func):
+    seconds = timeit.timeit(func, number=FRAMES)
+    print(f"  {name:<24} {seconds / FRAMES * 1e6:10.1f} us/frame")
+
+
+def bench_async(name: str, show, frames: int = 200):
+    async def frame_loop():
+        start = time.perf_counter()
+        for i in range(frames):
+            await show(i / 20)
+        return time.perf_counter() - start
+    seconds = asyncio.run(frame_loop())
+    print(f"  {name:<24} {seconds / frames * 1e6:10.1f} us/frame")
+
+
+def main():
+    effects = {
+        "solid": SolidEffect(Color(200, 0, 0)),
+        "gradient": GradientEffect(Color(200, 0, 0), Color(0, 0, 200)),
+        "rainbow": RainbowEffect(),
+        "pulse": PulseEffect(Color(0, 200, 0)),
+    }
+    print("Frame generation and diffing only:")
+    for portal_count in [1, 10, 100, 500]:
+        print(f"{portal_count} portals, {portal_count * len(PLATFORMS)} platforms:")
+        positions = platform_positions(portal_count)
+        for name, effect in effects.items():
+            state = {"t": 0.0, "last": None}
+            def frame():
+                state["t"] += 1 / 20
+                new = render_frame(effect, state["t"], positions)
+                changed_platforms(state["last"], new)
+                state["last"] = new
+            bench(name, frame)
+
+    # A rainbow changes every platform on every frame, so this is the worst case for sending
+    print()
+    print("Whole frames of a rainbow, including building commands for no-op portals:")
+    for portal_count in [100, 500]:
+        print(f"{portal_count} portals, {portal_count * len(PLATFORMS)} platforms:")
+        effect = RainbowEffect()
+        renderer = EffectRenderer([NoOpPortal() for _ in range(portal_count)])
+        bench_async("renderer, set all", lambda t: renderer.show(effect, t))
+        renderer = EffectRenderer([NoOpPortal(set_all=False) for _ in range(portal_count)])
+        bench_async("renderer, set one", lambda t: renderer.show(effect, t))
+        loop = PythonLoopRenderer([NoOpPortal() for _ in range(portal_count)])
+        bench_async("python loop, set one", loop.show)
+
+
+if __name__ == '__main__':
+    main()
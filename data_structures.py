@@ -133,6 +133,12 @@ class CommsDefinition(ABC):
         """Whether the base uses a sector parameter for NFC commands (i.e. designed for Mifare Classic, like DI is)"""
         pass
 
+    @classmethod
+    @abstractmethod
+    def has_set_all(cls) -> bool:
+        """Whether the base accepts SET_ALL as an enable flag and color for each platform, in platform order"""
+        pass
+
     @classmethod
     @abstractmethod
     def ticks_per_second(cls) -> int:
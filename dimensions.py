@@ -46,6 +46,11 @@ class LegoCommsDefinition(CommsDefinition):
         """Whether the base uses a sector parameter for NFC commands (i.e. designed for Mifare Classic, like DI is)"""
         return False
 
+    @classmethod
+    def has_set_all(cls) -> bool:
+        """Whether the base accepts SET_ALL as an enable flag and color for each platform, in platform order"""
+        return True
+
     @classmethod
     def ticks_per_second(cls) -> int:
         """Number of 'ticks', i.e. the number to put in the duration field to get 1 second"""
@@ -55,8 +60,8 @@ class LegoCommsDefinition(CommsDefinition):
 class LegoComms(Comms):
     comms_def = LegoCommsDefinition()
 
-    def __init__(self, serial: str = None):
-        super().__init__(serial)
+    def __init__(self, serial: str = None, request_timeout: float = 5.0):
+        super().__init__(serial, request_timeout)
 
     async def _unpack_tag_event(self, data: bytes) -> TagChangeEvent:
         tag = Tag(data[0], data[2], data[1], data[4:11])
@@ -70,6 +75,6 @@ class LegoComms(Comms):
 class LegoPortal(Portal):
     comms_def = LegoCommsDefinition()
 
-    def __init__(self, serial: str | None = None):
-        super().__init__(LegoComms(serial))
+    def __init__(self, serial: str | None = None, request_timeout: float = 5.0):
+        super().__init__(LegoComms(serial, request_timeout))
 
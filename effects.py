@@ -0,0 +1,189 @@
+from abc import ABC, abstractmethod
+from data_structures import *
+from typing import TYPE_CHECKING
+import asyncio
+import numpy as np
+import time
+
+if TYPE_CHECKING:
+    # Only needed for annotations, and importing it requires HID support
+    from portal import Portal
+
+PLATFORMS = [Platform.CENTER, Platform.PLAYER_ONE, Platform.PLAYER_TWO]
+
+
+class Effect(ABC):
+    """A lighting effect computed for every platform of every portal at once.
+
+    Effects are a function of time and each platform's position across the whole fleet,
+    so portals rendered from the same clock stay in sync with each other.
+    """
+
+    @abstractmethod
+    def render(self, t: float, positions: np.ndarray) -> np.ndarray:
+        """Compute the colors for a single frame
+
+        Arguments:
+        t -- seconds since the effect started
+        positions -- (portals, platforms) array of each platform's position across the fleet, 0.0-1.0
+
+        Returns a (portals, platforms, 3) array of RGB values, 0-255.
+        """
+        pass
+
+
+class SolidEffect(Effect):
+    def __init__(self, color: Color):
+        self.color = np.array(list(color), dtype=np.float32)
+
+    def render(self, t: float, positions: np.ndarray) -> np.ndarray:
+        return np.broadcast_to(self.color, positions.shape + (3,))
+
+
+class GradientEffect(Effect):
+    def __init__(self, start: Color, end: Color, speed: float = 0.25):
+        """A gradient between two colors that scrolls across the fleet
+
+        Arguments:
+        start -- the color at one end of the gradient
+        end -- the color at the other end of the gradient
+        speed -- the number of times per second the gradient scrolls across the whole fleet
+        """
+        self.start = np.array(list(start), dtype=np.float32)
+        self.end = np.array(list(end), dtype=np.float32)
+        self.speed = speed
+
+    def render(self, t: float, positions: np.ndarray) -> np.ndarray:
+        # Cosine so the gradient wraps around smoothly instead of jumping from end back to start
+        mix = 0.5 - 0.5 * np.cos(2 * np.pi * (positions - t * self.speed))
+        return self.start + (self.end - self.start) * mix[..., np.newaxis]
+
+
+class RainbowEffect(Effect):
+    def __init__(self, speed: float = 0.25, spread: float = 1.0, brightness: float = 1.0):
+        """A rainbow that cycles across the fleet
+
+        Arguments:
+        speed -- the number of full hue cycles per second
+        spread -- the number of full hue cycles spread across the whole fleet at once
+        brightness -- the brightness of the colors, 0.0-1.0
+        """
+        self.speed = speed
+        self.spread = spread
+        self.brightness = brightness
+
+    def render(self, t: float, positions: np.ndarray) -> np.ndarray:
+        hue = (positions * self.spread + t * self.speed) % 1.0
+        # Fully saturated HSV to RGB, with the R/G/B channels offset by a third of the hue circle each
+        channels = (hue[..., np.newaxis] * 6 + np.array([0, 4, 2])) % 6
+        return np.clip(np.abs(channels - 3) - 1, 0, 1) * (255 * self.brightness)
+
+
+class PulseEffect(Effect):
+    def __init__(self, color: Color, period: float = 1.0):
+        """Fade every platform in and out together
+
+        Arguments:
+        color -- the color at full brightness
+        period -- the duration of one off-on-off cycle in seconds
+        """
+        self.color = np.array(list(color), dtype=np.float32)
+        self.period = period
+
+    def render(self, t: float, positions: np.ndarray) -> np.ndarray:
+        level = 0.5 - 0.5 * np.cos(2 * np.pi * t / self.period)
+        return np.broadcast_to(self.color * level, positions.shape + (3,))
+
+
+def platform_positions(portal_count: int) -> np.ndarray:
+    """Lay out every platform of every portal in order along a single line from 0.0 to 1.0"""
+    count = portal_count * len(PLATFORMS)
+    return np.linspace(0.0, 1.0, count, endpoint=False).reshape(portal_count, len(PLATFORMS))
+
+
+def render_frame(effect: Effect, t: float, positions: np.ndarray) -> np.ndarray:
+    """Render an effect into a (portals, platforms, 3) array of bytes ready to send"""
+    frame = effect.render(t, positions)
+    return np.clip(np.rint(frame), 0, 255).astype(np.uint8)
+
+
+def changed_platforms(previous: np.ndarray | None, frame: np.ndarray) -> np.ndarray:
+    """Get a (portals, platforms) mask of the platforms whose color differs from the previous frame"""
+    if previous is None:
+        return np.ones(frame.shape[:2], dtype=bool)
+    return np.any(previous != frame, axis=-1)
+
+
+class EffectRenderer:
+    def __init__(self, portals: list["Portal"], use_set_all: bool = True):
+        """Render effects across a group of portals, only sending commands for platforms that changed
+
+        Arguments:
+        portals -- the portals to render to, in the order they are laid out
+        use_set_all -- whether to update several platforms on one portal with a single command when supported
+        """
+        self.portals = portals
+        self.use_set_all = use_set_all
+        self.positions = platform_positions(len(portals))
+        self.last_frame = None
+        # Portals whose last update failed, so they get the whole of the next frame
+        self.failed = np.zeros(len(portals), dtype=bool)
+
+    def reset(self):
+        """Forget the last frame sent, so the next frame is sent in full"""
+        self.last_frame = None
+        self.failed[:] = False
+
+    async def show(self, effect: Effect, t: float):
+        """Render a single frame of an effect and send it to the portals
+
+        Arguments:
+        effect -- the effect to render
+        t -- seconds since the effect started
+
+        A portal that fails to update doesn't stop the others, it's reported and sent the
+        whole of the next frame instead.
+        """
+        frame = render_frame(effect, t, self.positions)
+        changed = changed_platforms(self.last_frame, frame)
+        changed[self.failed] = True
+        indices = np.flatnonzero(changed.any(axis=1))
+        # Send to every portal at once so they update together
+        results = await asyncio.gather(
+            *[self._send(self.portals[i], frame[i].tolist(), changed[i].tolist()) for i in indices],
+            return_exceptions=True)
+        for i, result in zip(indices, results):
+            self.failed[i] = isinstance(result, BaseException)
+            if isinstance(result, Exception):
+                print(f"Failed to update portal {i}: {result!r}")
+            elif isinstance(result, BaseException):
+                raise result
+        self.last_frame = frame
+
+    async def run(self, effect: Effect, fps: float = 20, duration: float | None = None):
+        """Play an effect until the duration has passed, or forever if no duration is given
+
+        Arguments:
+        effect -- the effect to play
+        fps -- the number of frames to render per second
+        duration -- how long to play the effect for in seconds
+        """
+        start = time.monotonic()
+        interval = 1 / fps
+        frame_number = 0
+        while True:
+            t = time.monotonic() - start
+            if duration is not None and t >= duration:
+                break
+            await self.show(effect, t)
+            frame_number += 1
+            # Schedule against the start time rather than the last frame so slow frames don't cause drift
+            await asyncio.sleep(max(0, start + frame_number * interval - time.monotonic()))
+
+    async def _send(self, portal: "Portal", colors: list[list[int]], changed: list[bool]):
+        if self.use_set_all and sum(changed) > 1 and portal.comms_def.has_set_all():
+            await portal.set_all_colors([Color(*color) if c else None for color, c in zip(colors, changed)])
+            return
+        for platform, color, c in zip(PLATFORMS, colors, changed):
+            if c:
+                await portal.set_color(platform, Color(*color))
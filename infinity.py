@@ -45,6 +45,12 @@ class InfinityCommsDefinition(CommsDefinition):
         """Whether the base uses a sector parameter for NFC commands (i.e. designed for Mifare Classic, like DI is)"""
         return True
 
+    @classmethod
+    def has_set_all(cls) -> bool:
+        """Whether the base accepts SET_ALL as an enable flag and color for each platform, in platform order"""
+        # The DI base has a SET_ALL command, but its layout hasn't been confirmed to match the LD one
+        return False
+
     @classmethod
     def ticks_per_second(cls) -> int:
         """Number of 'ticks', i.e. the number to put in the duration field to get 1 second"""
@@ -70,8 +76,8 @@ class InfinityComms(Comms):
 class InfinityPortal(Portal):
     comms_def = InfinityCommsDefinition()
 
-    def __init__(self, serial: str | None = None):
-        super().__init__(InfinityComms(serial))
+    def __init__(self, serial: str | None = None, request_timeout: float = 5.0):
+        super().__init__(InfinityComms(serial, request_timeout))
 
     async def connect(self):
         await super().connect()
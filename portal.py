@@ -9,14 +9,23 @@ import hid
 class Comms(ABC):
     comms_def: CommsDefinition
 
-    def __init__(self, serial: str | None = None):
+    def __init__(self, serial: str | None = None, request_timeout: float = 5.0):
+        """
+        Arguments:
+        serial -- the serial number of the base to connect to, or None for the first one found
+        request_timeout -- seconds to wait for a reply before a request raises asyncio.TimeoutError
+        """
         self.device = self._init_base(serial)
         self.finish = False
         self.pending_requests = {}
+        # IDs of requests that were given up on, so a late reply isn't mistaken for an unknown message
+        self.expired_requests = set()
         self.message_number = 0
         self.observers = []
         self.lock = asyncio.Lock()
         self.uid_cache = {}
+        self.tasks = set()
+        self.request_timeout = request_timeout
 
 
     def _init_base(self, serial: str | None):
@@ -34,14 +43,22 @@ class Comms(ABC):
             if fields[0] == self.comms_def.reply_standard_id(): # reply message
                 length = fields[1]
                 message_id = fields[2]
-                if message_id in self.pending_requests:
-                    # TODO: might be good to check that the checksum matches
-                    self.pending_requests[message_id].set_result(fields[3:length+2])
-                    del self.pending_requests[message_id]
+                request = self.pending_requests.pop(message_id, None)
+                if request is not None:
+                    # The request may have timed out and be cleaning up, in which case nobody wants the reply
+                    if not request.done():
+                        # TODO: might be good to check that the checksum matches
+                        request.set_result(fields[3:length+2])
+                    continue
+                if message_id in self.expired_requests:
+                    self.expired_requests.discard(message_id)
                     continue
             elif fields[0] == self.comms_def.reply_standard_id() + 1: # event message
                 # Do on a separate task in case observers send commands
-                asyncio.create_task(self._generate_event(fields[2:]))
+                # Keep a reference so the task isn't garbage collected, and drop it once it's done
+                task = asyncio.create_task(self._generate_event(fields[2:]))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
                 continue
             self._unknown_message(fields)
 
@@ -63,7 +80,7 @@ class Comms(ABC):
                 uid = await self._fetch_tag_uid(tag)
                 self.uid_cache[tag.index] = uid
                 return uid
-            except ValueError:
+            except (ValueError, asyncio.TimeoutError):
                 # Oh well, we tried
                 return None
 
@@ -77,7 +94,7 @@ class Comms(ABC):
                     try:
                         event.tag.uid = await self._fetch_tag_uid(event.tag)
                         self.uid_cache[event.tag.index] = event.tag.uid
-                    except ValueError:
+                    except (ValueError, asyncio.TimeoutError):
                         pass
         else:
             self.uid_cache[event.tag.index] = event.tag.uid
@@ -107,9 +124,17 @@ class Comms(ABC):
         message_id, message = self._construct_message(self.get_command(command), bytes(data))
         result = asyncio.get_event_loop().create_future()
         self.pending_requests[message_id] = result
-        async with self.lock:
-            self.device.write(message)
-        return await result
+        self.expired_requests.discard(message_id)
+        try:
+            async with self.lock:
+                self.device.write(message)
+            return await asyncio.wait_for(result, self.request_timeout)
+        finally:
+            # If the reply never came, don't keep waiting for it forever.
+            # Message IDs wrap around, so make sure a newer request hasn't taken this slot.
+            if self.pending_requests.get(message_id) is result:
+                del self.pending_requests[message_id]
+                self.expired_requests.add(message_id)
 
     def _construct_message(self, command: int, data: bytes):
         message_id = self._next_message_number()
@@ -144,6 +169,11 @@ class Comms(ABC):
 
 
 class Portal(ABC):
+    """A connected base.
+
+    Every method that talks to the base raises asyncio.TimeoutError if it doesn't reply
+    within the request timeout given to its Comms.
+    """
     comms_def: CommsDefinition
 
     def __init__(self, comms: Comms):
@@ -193,6 +223,25 @@ class Portal(ABC):
         """
         await self.comms.send_message(CommandType.SET_ONE, [int(platform), *color])
 
+    async def set_all_colors(self, colors: list[Color | None]):
+        """Set the color of every platform with a single command
+
+        Arguments:
+        colors -- the colors for each platform, in platform order starting from the center.
+                  None leaves that platform unchanged.
+
+        Raises ValueError if the base doesn't support this.
+        """
+        if not self.comms_def.has_set_all():
+            raise ValueError("Setting all platform colors at once is not supported by this base")
+        msg = []
+        for color in colors:
+            if color is None:
+                msg.extend([0, 0, 0, 0])
+            else:
+                msg.extend([1, *color])
+        await self.comms.send_message(CommandType.SET_ALL, msg)
+
     async def fade_color(self, platform: int | Platform, color: Color, duration: float = 1.0, count: int = 2):
         """Fade a platform color in and out according to the parameters.
 
@@ -239,6 +288,8 @@ class Portal(ABC):
         Keyword arguments:
         tag -- the tag to read from
         block -- the block to read from
+
+        Raises ValueError if the tag can't be read.
         """
         msg = [tag.index]
         if self.comms_def.has_nfc_sectors():
@@ -260,6 +311,8 @@ class Portal(ABC):
         Keyword arguments:
         tag -- the tag to read from
         block -- the block to read from
+
+        Raises ValueError if the tag can't be written.
         """
         msg = [tag.index]
         if self.comms_def.has_nfc_sectors():
@@ -0,0 +1,403 @@
+from collections import deque
+from dataclasses import dataclass, field
+from data_structures import *
+from dimensions import LegoComms
+from infinity import InfinityComms
+from portal import Comms, Portal
+import argparse
+import asyncio
+import queue
+import random
+import statistics
+import sys
+import threading
+import time
+
+try:
+    import psutil
+    psutil_loaded = True
+except ImportError:
+    psutil_loaded = False
+
+
+class SimulatedDevice:
+    """Stands in for a hid.Device, answering requests and generating tag events like a real portal would"""
+
+    MAX_TAGS = 8
+
+    def __init__(self, comms_def: CommsDefinition, rng: random.Random, reply_loss: float = 0.0,
+                 late_reply: float = 0.0, late_delay: float = 0.0):
+        """
+        Arguments:
+        comms_def -- the portal type to imitate
+        rng -- source of randomness, so runs can be reproduced
+        reply_loss -- the chance of silently dropping the reply to a request, 0.0-1.0
+        late_reply -- the chance of holding back the reply to a request, 0.0-1.0
+        late_delay -- roughly how long to hold back late replies for in seconds. The actual delay
+                      varies either side of this, so set it to the request timeout to land replies
+                      just before, during and after a request gives up.
+        """
+        self.comms_def = comms_def
+        self.rng = rng
+        self.reply_loss = reply_loss
+        self.late_reply = late_reply
+        self.late_delay = late_delay
+        self.serial = "SIMULATED"
+        self.nonblocking = False
+        self.commands = {v: k for k, v in comms_def.get_command_set().items()}
+        self.tags = {} # index -> Tag
+        self.messages = queue.Queue()
+        self.replies_lost = 0
+        self.replies_late = 0
+        # Late replies that arrived after their message ID was reused, so could be taken for another request's reply
+        self.replies_misrouted = 0
+        self.write_times = deque()
+        self.writes = {} # message ID -> number of the latest write to use it
+        self.write_count = 0
+
+    def read(self, size: int, timeout: int) -> bytes:
+        try:
+            return self.messages.get(timeout=timeout / 1000)
+        except queue.Empty:
+            return b""
+
+    def write(self, message: bytes):
+        length = message[2]
+        command = self.commands[message[3]]
+        message_id = message[4]
+        data = message[5:length + 3]
+        self.write_count += 1
+        self.writes[message_id] = self.write_count
+        self.write_times.append(time.monotonic())
+        if self.rng.random() < self.reply_loss:
+            self.replies_lost += 1
+            return
+        payload = bytes([message_id]) + self._reply(command, data)
+        if self.rng.random() < self.late_reply:
+            self.replies_late += 1
+            delay = self.rng.uniform(self.late_delay * 0.8, self.max_reply_delay())
+            threading.Timer(delay, self._queue_late, (message_id, self.write_count, payload)).start()
+            return
+        self._queue(self.comms_def.reply_standard_id(), payload)
+
+    def max_reply_delay(self) -> float:
+        """The longest a late reply can be held back for, in seconds"""
+        return self.late_delay * 1.2
+
+    def writes_within(self, seconds: float) -> int:
+        """Number of requests written in the last `seconds` seconds"""
+        cutoff = time.monotonic() - seconds
+        while self.write_times and self.write_times[0] < cutoff:
+            self.write_times.popleft()
+        return len(self.write_times)
+
+    def add_tag(self) -> Tag | None:
+        free = [i for i in range(self.MAX_TAGS) if i not in self.tags]
+        if len(free) == 0:
+            return None
+        sak = 0x09 if self.comms_def.has_nfc_sectors() else 0x00
+        uid = self.rng.randbytes(4 if self.comms_def.has_nfc_sectors() else 7)
+        tag = Tag(self.rng.choice(list(Platform)[1:]).value, self.rng.choice(free), sak, uid)
+        self.tags[tag.index] = tag
+        self._queue_event(tag, False)
+        return tag
+
+    def remove_tag(self) -> Tag | None:
+        if len(self.tags) == 0:
+            return None
+        tag = self.tags.pop(self.rng.choice(list(self.tags)))
+        self._queue_event(tag, True)
+        return tag
+
+    def _reply(self, command: CommandType, data: bytes) -> bytes:
+        if command == CommandType.LIST_TAGS:
+            return b"".join(bytes([(tag.platform << 4) | tag.index, tag.sak]) for tag in self.tags.values())
+        if command == CommandType.TAG_INFO:
+            if data[0] not in self.tags:
+                return bytes([ErrorType.NO_SUCH_TAG.value])
+            return b"\0" + self.tags[data[0]].uid
+        if command in (CommandType.READ_BLOCK, CommandType.WRITE_BLOCK):
+            if data[0] not in self.tags:
+                return bytes([ErrorType.NO_SUCH_TAG.value])
+            if command == CommandType.READ_BLOCK:
+                return b"\0" + self.rng.randbytes(16)
+        return b"\0"
+
+    def _queue_late(self, message_id: int, write: int, payload: bytes):
+        if self.writes[message_id] != write:
+            self.replies_misrouted += 1
+        self._queue(self.comms_def.reply_standard_id(), payload)
+
+    def _queue_event(self, tag: Tag, is_removed: bool):
+        data = bytes([tag.platform, tag.sak, tag.index, is_removed])
+        if not self.comms_def.has_nfc_sectors():
+            # LD events carry the UID along with them
+            data += tag.uid
+        self._queue(self.comms_def.reply_standard_id() + 1, data)
+
+    def _queue(self, message_type: int, payload: bytes):
+        message = bytes([message_type, len(payload)]) + payload
+        message += bytes([sum(message) & 0xFF])
+        self.messages.put(message + b"\0" * (32 - len(message)))
+
+
+def simulated_comms(comms_cls: type[Comms], device: SimulatedDevice, request_timeout: float = 5.0) -> Comms:
+    """Create a Comms of the given type that talks to a simulated device instead of a real one"""
+    class SimulatedComms(comms_cls):
+        unknown_messages = 0
+
+        def _init_base(self, serial: str | None):
+            return device
+
+        def _unknown_message(self, fields):
+            self.unknown_messages += 1
+    return SimulatedComms(request_timeout=request_timeout)
+
+
+class SimulatedPortal(Portal):
+    def __init__(self, comms: Comms):
+        self.comms_def = comms.comms_def
+        super().__init__(comms)
+
+
+def current_rss() -> int | None:
+    """Resident memory of this process in bytes, if it can be found"""
+    if psutil_loaded:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            import resource
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, ImportError):
+        return None
+
+
+@dataclass
+class Sample:
+    virtual_time: float
+    pending_requests: int
+    stale_requests: int
+    comms_tasks: int
+    live_tasks: int
+    uid_cache: int
+    wrong_uids: int
+    rss: int | None
+    reader_alive: bool
+
+
+@dataclass
+class SoakReport:
+    kind: str
+    virtual_seconds: float
+    requests: int = 0
+    timeouts: int = 0
+    errors: int = 0
+    tag_events: int = 0
+    replies_lost: int = 0
+    replies_late: int = 0
+    replies_misrouted: int = 0
+    unknown_messages: int = 0
+    crashes: int = 0
+    samples: list[Sample] = field(default_factory=list)
+    failures: list[str] = field(default_factory=list)
+
+    @property
+    def passed(self) -> bool:
+        return len(self.failures) == 0
+
+    def format(self) -> str:
+        lines = [
+            f"Soak test: {self.kind} portal, {self.virtual_seconds / 3600:.2f} virtual hours",
+            f"  requests: {self.requests}, timed out: {self.timeouts}, errors: {self.errors}",
+            f"  tag events: {self.tag_events}, replies lost: {self.replies_lost}, replies late: {self.replies_late}",
+            f"  replies misrouted: {self.replies_misrouted}, unknown messages: {self.unknown_messages}, "
+            f"crashed requests: {self.crashes}",
+            "",
+            f"{'time (h)':>9} {'pending':>8} {'stale':>6} {'comms tasks':>12} {'live tasks':>11} {'uid cache':>10} {'wrong':>6} {'RSS (MiB)':>10} {'reader':>7}",
+        ]
+        for s in self.samples:
+            rss = "-" if s.rss is None else f"{s.rss / 2**20:.1f}"
+            lines.append(f"{s.virtual_time / 3600:9.2f} {s.pending_requests:8} {s.stale_requests:6} {s.comms_tasks:12} "
+                         f"{s.live_tasks:11} {s.uid_cache:10} {s.wrong_uids:6} {rss:>10} {'up' if s.reader_alive else 'down':>7}")
+        lines.append("")
+        if self.passed:
+            lines.append("PASSED: no unbounded growth detected")
+        else:
+            lines.append("FAILED:")
+            lines.extend(f"  {failure}" for failure in self.failures)
+        return "\n".join(lines)
+
+
+def check_growth(report: SoakReport, count_slack: int = 2, rss_slack: int = 16 * 2**20):
+    """Flag any metric that keeps growing after the first half of the run
+
+    Counters should level off once the portal reaches a steady state, so the peak in the
+    second half may not exceed the peak in the first half by more than `count_slack`.
+    Memory is noisier, so instead the trend over the second half is projected across
+    the whole run and must stay within `rss_slack` bytes.
+    The UID cache is keyed by tag index, so its size is bounded; what matters is that it
+    never holds a UID for a tag that has gone, or the old UID for an index that was reused.
+    Requests that nobody is waiting on any more should never be kept around at all,
+    and the task reading from the portal must never stop.
+    Every message from the portal should be matched up with the request it answers.
+    """
+    if report.replies_misrouted > 0:
+        report.failures.append(f"{report.replies_misrouted} late replies arrived after their message ID was reused")
+    if report.unknown_messages > 0:
+        report.failures.append(f"{report.unknown_messages} messages from the portal weren't recognized")
+    if report.crashes > 0:
+        report.failures.append(f"{report.crashes} requests failed with an unexpected error")
+    if not all(s.reader_alive for s in report.samples):
+        stopped = next(s for s in report.samples if not s.reader_alive)
+        report.failures.append(f"Comms reader stopped by {stopped.virtual_time / 3600:.2f} hours")
+    if len(report.samples) < 4:
+        report.failures.append("Not enough samples to judge growth, run for longer")
+        return
+    half = len(report.samples) // 2
+    first, second = report.samples[:half], report.samples[half:]
+    stale = max(s.stale_requests for s in report.samples)
+    if stale > 0:
+        report.failures.append(f"Up to {stale} abandoned requests were still waiting for a reply")
+    wrong_uids = max(s.wrong_uids for s in report.samples)
+    if wrong_uids > 0:
+        report.failures.append(f"uid_cache held up to {wrong_uids} UIDs for tags that were gone or had changed")
+    for name in ["pending_requests", "comms_tasks", "live_tasks"]:
+        before = max(getattr(s, name) for s in first)
+        after = max(getattr(s, name) for s in second)
+        if after > before + count_slack:
+            report.failures.append(f"{name} grew from a peak of {before} to {after}")
+    rss = [(s.virtual_time, s.rss) for s in second if s.rss is not None]
+    if len(rss) >= 2:
+        slope, _ = statistics.linear_regression(*zip(*rss))
+        growth = slope * report.virtual_seconds
+        if growth > rss_slack:
+            report.failures.append(f"RSS trending upwards by {growth / 2**20:.1f} MiB over the run")
+
+
+async def soak(comms_cls: type[Comms] = LegoComms, hours: float = 4.0, tick: float = 1.0,
+               samples: int = 48, churn: float = 0.05, commands: int = 4,
+               reply_loss: float = 0.001, late_reply: float = 0.002, seed: int = 0) -> SoakReport:
+    """Run a simulated portal for a long stretch of virtual time and report on resource usage
+
+    Arguments:
+    comms_cls -- the type of portal to simulate
+    hours -- the amount of virtual time to run for
+    tick -- the virtual seconds that pass between each round of commands and tag changes
+    samples -- the number of times to record resource usage over the run
+    churn -- the chance of a tag being added or removed each tick, 0.0-1.0
+    commands -- the average number of commands to send each tick
+    reply_loss -- the chance of the portal never replying to a request, 0.0-1.0
+    late_reply -- the chance of the portal replying around the time the request gives up, 0.0-1.0
+    seed -- seed for the random number generator, so runs can be reproduced
+    """
+    rng = random.Random(seed)
+    # Lost replies still cost real time, so don't wait as long as a real portal would
+    request_timeout = 0.05
+    device = SimulatedDevice(comms_cls.comms_def, rng, reply_loss, late_reply, request_timeout)
+    # Ticks run as fast as they can, but a real portal is never sent anywhere near 256 requests
+    # before a late reply turns up. Hold back whenever that gets close, so message IDs can't
+    # wrap around while a reply is still on its way and have it taken for another request's.
+    reply_window = max(request_timeout, device.max_reply_delay())
+    id_budget = 128
+    comms = simulated_comms(comms_cls, device, request_timeout)
+    portal = SimulatedPortal(comms)
+    report = SoakReport(comms_cls.__name__.removesuffix("Comms"), hours * 3600)
+
+    async def on_change(event: TagChangeEvent):
+        report.tag_events += 1
+    portal.on_tags_changed = on_change
+
+    async def command():
+        report.requests += 1
+        choice = rng.random()
+        if choice < 0.5:
+            platform = rng.choice(list(Platform)[1:])
+            request = portal.set_color(platform, Color(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        elif choice < 0.8 or len(device.tags) == 0:
+            request = portal.get_all_tags()
+        else:
+            request = portal.read_tag(rng.choice(list(device.tags.values())), 0)
+        try:
+            # Don't let a request that never finishes stall the whole run, it'll show up in the samples instead
+            await asyncio.wait_for(request, comms.request_timeout * 10)
+        except asyncio.TimeoutError:
+            report.timeouts += 1
+        except ValueError:
+            report.errors += 1
+        except Exception as e:
+            # e.g. a reply meant for a different request that couldn't be parsed
+            report.crashes += 1
+            print(f"Request failed unexpectedly: {e!r}")
+
+    async def settle():
+        # Let the reader catch up with every event, and the events finish, so the cache should be up to date
+        quiet = 0
+        while quiet < 2:
+            quiet = quiet + 1 if device.messages.empty() and len(comms.tasks) == 0 else 0
+            await asyncio.sleep(0.005)
+
+    def wrong_uids() -> int:
+        return sum(index not in device.tags or device.tags[index].uid != uid
+                   for index, uid in comms.uid_cache.items())
+
+    await portal.connect()
+    ticks = int(report.virtual_seconds / tick)
+    sample_every = max(1, ticks // samples)
+    try:
+        for i in range(1, ticks + 1):
+            while device.writes_within(reply_window) > id_budget:
+                await asyncio.sleep(reply_window / 10)
+            if rng.random() < churn:
+                # Keep the portal around half full
+                if rng.random() < 0.5 + 0.1 * (SimulatedDevice.MAX_TAGS / 2 - len(device.tags)):
+                    device.add_tag()
+                else:
+                    device.remove_tag()
+            await asyncio.gather(*[command() for _ in range(rng.randint(0, commands * 2))])
+            if i % sample_every == 0:
+                await settle()
+                report.samples.append(Sample(
+                    virtual_time=i * tick,
+                    pending_requests=len(comms.pending_requests),
+                    stale_requests=sum(request.done() for request in comms.pending_requests.values()),
+                    comms_tasks=len(comms.tasks),
+                    live_tasks=len(asyncio.all_tasks()),
+                    uid_cache=len(comms.uid_cache),
+                    wrong_uids=wrong_uids(),
+                    rss=current_rss(),
+                    reader_alive=not portal.comms_task.done(),
+                ))
+    finally:
+        portal.disconnect()
+    report.replies_lost = device.replies_lost
+    report.replies_late = device.replies_late
+    report.replies_misrouted = device.replies_misrouted
+    report.unknown_messages = comms.unknown_messages
+    check_growth(report)
+    return report
+
+
+def main():
+    kinds = {"lego": LegoComms, "infinity": InfinityComms}
+    parser = argparse.ArgumentParser(description="Soak test the portal driver against a simulated portal")
+    parser.add_argument("--portal", choices=kinds.keys(), default="lego")
+    parser.add_argument("--hours", type=float, default=4.0, help="virtual hours to run for")
+    parser.add_argument("--churn", type=float, default=0.05, help="chance of a tag change each virtual second")
+    parser.add_argument("--commands", type=int, default=4, help="average commands per virtual second")
+    parser.add_argument("--reply-loss", type=float, default=0.001, help="chance of a reply being lost")
+    parser.add_argument("--late-reply", type=float, default=0.002, help="chance of a reply arriving around the timeout")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", help="file to write the report to")
+    args = parser.parse_args()
+
+    report = asyncio.run(soak(kinds[args.portal], hours=args.hours, churn=args.churn, commands=args.commands,
+                              reply_loss=args.reply_loss, late_reply=args.late_reply, seed=args.seed))
+    text = report.format()
+    print(text)
+    if args.report:
+        with open(args.report, "w") as f:
+            f.write(text + "\n")
+    sys.exit(0 if report.passed else 1)
+
+if __name__ == '__main__':
+    main()
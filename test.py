@@ -36,7 +36,7 @@ async def run_base(base: Portal):
             try:
                 data = await base.read_tag(event.tag, 0)
                 print(f"Tag data, block 0: {data.hex()}")
-            except ValueError as e:
+            except (ValueError, asyncio.TimeoutError) as e:
                 print(f"Failed to read tag data: {e}")
 
             if not is_lego or not ndef_loaded:
@@ -72,7 +72,7 @@ async def run_base(base: Portal):
                             # Zeroed out, fine to overwrite
                             continue
                     return # Otherwise we don't know what it is and shouldn't overwrite it
-            except ValueError:
+            except (ValueError, asyncio.TimeoutError):
                 return
 
             print("Writing URL to tag...")
@@ -84,7 +84,7 @@ async def run_base(base: Portal):
                         # Pad out to 4 bytes if we come up short
                         chunk += b'\0' * (BYTES_PER_BLOCK - len(chunk))
                     await base.write_tag(event.tag, (index // BYTES_PER_BLOCK) + BLOCK_START, chunk)
-            except ValueError as e:
+            except (ValueError, asyncio.TimeoutError) as e:
                 print(f"Failed to write tag data: {e}")
             print("URL written, try tapping your phone to it")
 